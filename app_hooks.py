@@ -0,0 +1,11 @@
+import metrics
+import store
+
+
+def on_server_loaded(server_context):
+    # load the datasets once per process, sessions only get references to them
+    store.load()
+
+
+def on_session_destroyed(session_context):
+    metrics.untrack_session(session_context.id)
@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import platform
+import random
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from statistics import mean, median
+from timeit import repeat
+import bokeh
+import pandas as pd
+from bokeh.application import Application
+from bokeh.application.handlers import DirectoryHandler
+from bokeh.client import pull_session
+from bokeh.models import Select, Slider
+from bokeh.protocol import Protocol
+from bokeh.server.server import Server
+from tornado.ioloop import IOLoop
+import data
+import store
+from config import Config
+
+APP_PATH = Path(__file__).parent
+METRICS = ['time', 'peak_memory', 'payload']
+
+
+def measure(action, number=3, events=None):
+    # median wall time of `number` runs, then one traced run for the peak memory
+    # and, for dashboard callbacks, the size of the document patch sent to the browser
+    timings = repeat(action, number=1, repeat=number)
+
+    if events is not None:
+        events.clear()
+    tracemalloc.start()
+    action()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    payload = None
+    if events is not None:
+        # the json content and the binary buffers carrying the arrays
+        message = Protocol().create('PATCH-DOC', list(events))
+        payload = len(message.content_json) + sum(len(buffer) for _, buffer in message.buffers)
+
+    return {'time': median(timings), 'peak_memory': peak_memory, 'payload': payload}
+
+
+def benchmark_loaders(number):
+    return {
+        'get_education_data': measure(data.get_education_data, number),
+        'get_hlo_data': measure(data.get_hlo_data, number),
+        'get_gdp_data': measure(data.get_gdp_data, number),
+        'get_geo_data': measure(data.get_geo_data, number),
+        'get_merged_data': measure(lambda: data.get_merged_data(cache=False), number),
+        'get_merged_data (parallel)': measure(lambda: data.get_merged_data(cache=False, parallel=True), number),
+        'get_merged_data (cached)': measure(data.get_merged_data, number),
+    }
+
+
+def benchmark_year_slicing(number):
+    if Config.STORAGE != 'wide':
+        return {}
+
+    df, _ = store.get_data()
+    dates = Config(df).DATES
+
+    # a slider change sliced the frame three times (map/scatter, gender and level bar chart)
+    before = measure(lambda: [df.xs(year, level='year') for year in dates for _ in range(3)], number)
+    after = measure(lambda: [store.get_year(year) for year in dates for _ in range(3)], number)
+    for result in [before, after]:
+        result['time'] /= len(dates)
+
+    return {'year slicing (df.xs)': before, 'year slicing (year index)': after}
+
+
+def benchmark_ffill(number):
+    df, _, hlo, gdp = data.load_sources()
+    df = data.get_education_data(df).join(hlo).join(gdp, on=['country_code', 'year'])
+
+    def groupby_ffill():
+        # the forward fill and year filter of get_merged_data before the dense array
+        filled = df.sort_index(level='year').groupby(['country_code']).ffill()
+        return filled[filled.index.isin([year for year in range(2000, 2021)], level='year')]
+
+    def dense_ffill():
+        filled = data.ffill_years(df)
+        years = filled.index.get_level_values('year')
+        return filled[(years >= 2000) & (years <= 2020)]
+
+    pd.testing.assert_frame_equal(groupby_ffill().sort_index(), dense_ffill())
+    return {'ffill (groupby)': measure(groupby_ffill, number), 'ffill (dense array)': measure(dense_ffill, number)}
+
+
+def create_document():
+    # callbacks are measured as if run synchronously (see store.create_document), comparable to earlier results
+    doc = store.create_document()
+    events = []
+    doc.on_change(events.append)
+    return doc, events
+
+
+def benchmark_callbacks(number):
+    doc, events = create_document()
+    slider = doc.select_one({'type': Slider})
+    selects = {select.title: select for select in doc.select({'type': Select})}
+    source = doc.get_model_by_name('source')
+
+    def cycle(widget, values):
+        # every call sets the value after the widget's current one, so each run triggers the callback
+        state = {'i': values.index(widget.value) if widget.value in values else -1}
+
+        def action():
+            state['i'] += 1
+            widget.value = values[state['i'] % len(values)]
+        return action
+
+    def select_countries():
+        source.selected.indices = list(range(0, len(source.data['country_code']), 10))
+        source.selected.indices = []
+
+    def cold(action):
+        # the chart cache is emptied before every run, so each one computes its chart data
+        def run():
+            store.clear_cache()
+            action()
+        return run
+
+    # callback actions and the number of widget states they cycle through
+    callbacks = {
+        'update_data': (cycle(slider, [slider.start, slider.end]), 2),
+        'update_view_tools': (cycle(selects['Indicator:'], list(Config.INDICATORS)), len(Config.INDICATORS)),
+        'update_view': (cycle(selects['Group by:'], Config.GROUP_BY), len(Config.GROUP_BY)),
+        'update_by_select': (select_countries, 1),
+    }
+    results = {name: measure(cold(action), number, events) for name, (action, _) in callbacks.items()}
+    for name, (action, states) in callbacks.items():
+        # every state of the cycle is cached before the runs
+        for _ in range(states):
+            action()
+        results[f'{name} (cached)'] = measure(action, number, events)
+    return results
+
+
+def start_server():
+    # a bokeh server of the dashboard on a free port, its event loop runs in a thread
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+    started = threading.Event()
+    servers = []
+
+    def run():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        server = Server({'/': Application(DirectoryHandler(filename=str(APP_PATH)))}, port=port, io_loop=IOLoop.current())
+        server.start()
+        servers.append(server)
+        started.set()
+        server.io_loop.start()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return servers[0], f'http://localhost:{port}/'
+
+
+def benchmark_sessions(number):
+    # latency of one session of a server while a second session is idle and while it keeps selecting
+    # countries: of a year change (from the slider change until the scatter source holds the year) and
+    # until a callback scheduled on the session runs (event loop and document lock are free), as means
+    # since the other session blocks only some of the calls
+    Config.CALLBACK_THROTTLE = 0
+    Config.METRICS = False
+    server, url = start_server()
+    clients = [pull_session(url=url) for _ in range(2)]
+    doc, busy_doc = [session.document for session in server.get_sessions('/')]
+
+    def run_on(document, callback):
+        # models of a session are only changed on the server's event loop under the document lock
+        done = threading.Event()
+
+        def run():
+            callback()
+            done.set()
+        server.io_loop.add_callback(lambda: document.add_next_tick_callback(run))
+        return done
+
+    slider = doc.select_one({'type': Slider})
+    updated = threading.Event()
+    run_on(doc, lambda: doc.get_model_by_name('source').on_change('data', lambda attr, old, new: updated.set())).wait()
+    state = {'year': slider.value}
+
+    def year_change():
+        state['year'] = slider.start if state['year'] == slider.end else slider.end
+        store.clear_cache()
+        updated.clear()
+        start = time.perf_counter()
+        run_on(doc, lambda: setattr(slider, 'value', state['year']))
+        updated.wait()
+        return time.perf_counter() - start
+
+    def next_tick():
+        start = time.perf_counter()
+        run_on(doc, lambda: None).wait()
+        return time.perf_counter() - start
+
+    def latency(busy, name):
+        stop = threading.Event()
+        busy_source = busy_doc.get_model_by_name('source')
+
+        def select():
+            # a new selection of half the countries every 100 ms, each one computes its lines and bars
+            # (seeded by the measurement, so no selection is in the chart cache from an earlier one)
+            rows, rng = range(len(busy_source.data['country_code'])), random.Random(name)
+            while not stop.is_set():
+                indices = sorted(rng.sample(rows, len(rows) // 2))
+                run_on(busy_doc, lambda: setattr(busy_source.selected, 'indices', indices))
+                time.sleep(0.1)
+
+        thread = threading.Thread(target=select)
+        if busy:
+            thread.start()
+            time.sleep(0.5)
+        timings = [year_change() for _ in range(number)]
+        ticks = []
+        for _ in range(number * 10):
+            ticks.append(next_tick())
+            time.sleep(0.01)
+        stop.set()
+        if busy:
+            thread.join()
+            # the queued selections finish before the next measurement
+            run_on(busy_doc, lambda: None).wait()
+            time.sleep(1)
+        return {
+            f'update_data ({name})': {'time': mean(timings), 'peak_memory': None, 'payload': None},
+            f'next tick ({name})': {'time': mean(ticks), 'peak_memory': None, 'payload': None},
+        }
+
+    results = {}
+    Config.BACKGROUND_CALLBACKS = True
+    results.update(latency(False, '2nd session idle'))
+    results.update(latency(True, '2nd session busy'))
+    Config.BACKGROUND_CALLBACKS = False
+    results.update(latency(True, '2nd busy, sync'))
+
+    for client in clients:
+        client.close()
+    server.io_loop.add_callback(server.stop)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # names of the benchmarks where a metric grew by more than `threshold` (relative)
+    regressions = []
+    for name, result in results.items():
+        for metric in METRICS:
+            old = baseline.get(name, {}).get(metric)
+            new = result[metric]
+            if old and new is not None and new > old * (1 + threshold):
+                regressions.append(f'{name} {metric}: {old:.4g} -> {new:.4g}')
+    return regressions
+
+
+def report(results):
+    print(f'{"benchmark":<32} {"time [ms]":>12} {"peak memory [MB]":>18} {"payload [kB]":>14}')
+    for name, result in results.items():
+        memory = '' if result['peak_memory'] is None else f'{result["peak_memory"] / 2**20:.2f}'
+        payload = '' if result['payload'] is None else f'{result["payload"] / 1024:.1f}'
+        print(f'{name:<32} {result["time"] * 1000:12.3f} {memory:>18} {payload:>14}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the data loaders and dashboard callbacks.')
+    parser.add_argument('--number', type=int, default=3, help='timed runs per benchmark')
+    parser.add_argument('--skip-loaders', action='store_true', help='only benchmark the dashboard')
+    parser.add_argument('--skip-sessions', action='store_true', help='do not start a server with two sessions')
+    parser.add_argument('--save', type=Path, help='write the results as JSON to this file')
+    parser.add_argument('--compare', type=Path, help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative growth counted as regression')
+    args = parser.parse_args()
+
+    store.load()
+    results = {}
+    if not args.skip_loaders:
+        results.update(benchmark_loaders(args.number))
+        results.update(benchmark_ffill(args.number))
+    results.update(benchmark_year_slicing(args.number))
+    results.update(benchmark_callbacks(args.number))
+    if not args.skip_sessions:
+        results.update(benchmark_sessions(args.number))
+    report(results)
+    print('chart cache:', ', '.join(f'{name} {count}' for name, count in store.get_cache_stats().items()))
+    print(f'dataset memory ({Config.STORAGE}): {store.get_memory_usage() / 2**20:.2f} MB')
+
+    if args.save:
+        args.save.write_text(json.dumps({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'environment': {
+                'python': platform.python_version(),
+                'pandas': pd.__version__,
+                'bokeh': bokeh.__version__,
+                'storage': Config.STORAGE,
+                'incremental_updates': Config.INCREMENTAL_UPDATES,
+            },
+            'results': results,
+            'chart_cache': store.get_cache_stats(),
+            'dataset_memory': int(store.get_memory_usage()),
+        }, indent=2))
+
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text())['results'], args.threshold)
+        for regression in regressions:
+            print('regression:', regression)
+        sys.exit(1 if regressions else 0)
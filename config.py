@@ -15,6 +15,45 @@ class Config():
     HEIGHT = 1000
     WIDTH = 2000
 
+    # mutate the existing figures on widget changes instead of replacing them
+    INCREMENTAL_UPDATES = True
+    # 'wide' keeps the merged frame per year, 'long' stores categorical keys with float32 values
+    STORAGE = 'wide'
+    # parse the data sources in a process pool when the merged dataset is (re)built
+    PARALLEL_LOADING = True
+    # missing values are forward filled with the last value of the country for at most FFILL_LIMIT years
+    # (None fills until the next value)
+    FFILL_LIMIT = None
+    # rapid widget changes (slider drags, repeated selections) are coalesced into at most one update per
+    # CALLBACK_THROTTLE ms with the latest state (0 updates on every change), SLIDER_THROTTLED only updates
+    # the year once the slider is released
+    CALLBACK_THROTTLE = 150
+    SLIDER_THROTTLED = False
+    # the data work of callbacks runs in a process wide thread pool outside the document lock, so one
+    # session's expensive selection does not block the others, only the model changes hold the lock
+    BACKGROUND_CALLBACKS = True
+    CALLBACK_WORKERS = 4
+    # chart data (ranges, sources, lines) computed for a widget state is kept for all sessions of the
+    # process, the least recently used entries are evicted beyond CHART_CACHE_SIZE
+    CHART_CACHE_SIZE = 1024
+    # callback, job and loader durations, the payload of source changes and the data held by every session
+    # are recorded and served in the Prometheus format at /metrics by serve.py, PROFILE_SAMPLE_RATE of the
+    # timed calls (e.g. 0.01) run under cProfile with the stats at /metrics/profile (0 disables it)
+    METRICS = True
+    PROFILE_SAMPLE_RATE = 0
+    # ship every year and level/gender of the selected indicator and by columns once (float32) and switch
+    # years, levels and genders in the browser with CustomJS instead of server callbacks
+    # (requires INCREMENTAL_UPDATES)
+    CLIENT_UPDATES = False
+    # 'auto' axis ranges span min to max of a column, ROBUST_RANGES clips them to the RANGE_QUANTILES
+    ROBUST_RANGES = False
+    RANGE_QUANTILES = (0.01, 0.99)
+    # selections with more countries only draw the MAX_LINES highest values of the selected year,
+    # LINE_OVERFLOW 'aggregate' adds the mean of the other countries as one line, 'drop' leaves them out
+    MAX_LINES = 10
+    LINE_OVERFLOW = 'aggregate'
+    LINE_OVERFLOW_COLOR = 'gray'
+
     INDICATORS = {
         'learning_outcome': {
             'range': 'auto',
@@ -65,7 +104,20 @@ class Config():
         },
     }
 
+    # map geometry from coarse to fine: simplification tolerance (degrees) and the visible
+    # longitude range (degrees) from which on a resolution is used, coordinates are sent as float32
+    GEO_RESOLUTIONS = [
+        {'tolerance': 0.5, 'min_width': 120},
+        {'tolerance': 0.1, 'min_width': 30},
+        {'tolerance': 0, 'min_width': 0},
+    ]
+    GEO_DTYPE = 'float32'
+    # shapely predicate of the countries a box or lasso selection on the map selects, 'intersects' (touched
+    # by the region) or 'within' (completely inside it), a tap selects the country under the pointer
+    MAP_SELECTION = 'intersects'
+
     GROUP_BY = ['income_group', 'region']
+    GROUP_WEIGHT = 'population_total_total'
     INFO_ITEMS = ['country_name', 'population', 'education_expenditure_gdp_rate', 'number_teachers']
     LEVELS = ['total', 'primary', 'secondary', 'tertiary']
     GENDER = ['total', 'female', 'male']
@@ -75,6 +127,9 @@ class Config():
         'total': '#ff7f0e',
         'male': '#1f77b4'
     }
+    GENDER_DODGE = [0.0, -0.15, 0.15]
+    LEVEL_DODGE = [-0.225, -0.075, 0.075, 0.225]
+
     LEVEL_COLORS = {
         'total': '#ff7f0e',
         'primary': '#2ca02c',
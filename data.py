@@ -1,12 +1,43 @@
 from lib2to3.pgen2.pgen import DFAState
 from locale import D_FMT
+import argparse
+import hashlib
+import io
+import itertools
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from pathlib import Path
+from metrics import timed
 
 DATA_PATH = Path(__file__).parent / 'data'
-
-
+CACHE_PATH = DATA_PATH / 'cache'
+STORE_PATH = DATA_PATH / 'store'
+
+EDUCATION_DATA_PATH = DATA_PATH / 'world_bank' / 'API_4_DS2_en_csv_v2_3160069.csv'
+EDUCATION_META_PATH = DATA_PATH / 'world_bank' / 'Metadata_Country_API_4_DS2_en_csv_v2_3160069.csv'
+EDUCATION_INDICATORS_PATH = DATA_PATH / 'world_bank' / 'selected_indicators.csv'
+HLO_DATA_PATH = DATA_PATH / 'world_bank' / 'hlo_database.xlsx'
+GDP_DATA_PATH = DATA_PATH / 'maddison' / 'mpd2020.xlsx'
+
+# source files the merged dataset is built from (a change invalidates the cache)
+MERGED_SOURCES = [
+    EDUCATION_DATA_PATH,
+    EDUCATION_META_PATH,
+    EDUCATION_INDICATORS_PATH,
+    HLO_DATA_PATH,
+    GDP_DATA_PATH,
+]
+# rows of the selected indicators of the World Bank CSV parsed at once (it holds every indicator of every country)
+EDUCATION_CHUNK_ROWS = 5000
+
+
+@timed('dashboard_loader_seconds', 'loader')
 def get_geo_data():
     PATH = DATA_PATH / 'ne_110m_admin_0_countries' / 'ne_110m_admin_0_countries.shp'
 
@@ -19,8 +50,30 @@ def get_geo_data():
     return df
 
 
+def create_geo_patches(df, tolerance=0, dtype='float64'):
+    # exterior rings as patch coordinates, parts of multi polygons are separated by NaN
+    # (the same coordinates GeoJSONDataSource would create in the browser), optionally
+    # simplified by `tolerance` (degrees) and quantized to a smaller float `dtype`
+    geometries = df.geometry.simplify(tolerance, preserve_topology=True) if tolerance else df.geometry
+    xs, ys = [], []
+    for geometry in geometries:
+        polygons = geometry.geoms if geometry.geom_type == 'MultiPolygon' else [geometry]
+        x, y = [], []
+        for polygon in polygons:
+            if x:
+                x.append(np.nan)
+                y.append(np.nan)
+            x.extend(polygon.exterior.xy[0])
+            y.extend(polygon.exterior.xy[1])
+        xs.append(np.array(x, dtype=dtype))
+        ys.append(np.array(y, dtype=dtype))
+
+    return pd.DataFrame({'xs': xs, 'ys': ys}, index=df.index)
+
+
+@timed('dashboard_loader_seconds', 'loader')
 def get_education_indicators(without_info=True):
-    PATH = DATA_PATH / 'world_bank' / 'selected_indicators.csv'
+    PATH = EDUCATION_INDICATORS_PATH
 
     df = pd.read_csv(PATH)
     df = df.set_index('indicator_code')
@@ -30,8 +83,9 @@ def get_education_indicators(without_info=True):
     return df
 
 
+@timed('dashboard_loader_seconds', 'loader')
 def get_education_meta(multi_index):
-    PATH = DATA_PATH / 'world_bank' / 'Metadata_Country_API_4_DS2_en_csv_v2_3160069.csv'
+    PATH = EDUCATION_META_PATH
 
     df = pd.read_csv(PATH)
     df = df.drop(columns=['Unnamed: 5', 'SpecialNotes'])
@@ -53,12 +107,27 @@ def get_education_meta(multi_index):
 
         levels = ['primary', 'secondary', 'tertiary', 'total']
         genders = ['male', 'female', 'total']
+        columns = {}
         for level in levels:
             for gender in genders:
-                df[('region', level, gender)] = df[('region', 'total', 'total')]
-                df[('income_group', level, gender)] = df[('income_group', 'total', 'total')]
-                df[('country_name', level, gender)] = df[('country_name', 'total', 'total')]
+                columns[('region', level, gender)] = df[('region', 'total', 'total')]
+                columns[('income_group', level, gender)] = df[('income_group', 'total', 'total')]
+                columns[('country_name', level, gender)] = df[('country_name', 'total', 'total')]
+        df = add_columns(df, columns)
+
+    return df
+
+
+def add_columns(df, columns):
+    # add all derived columns with one concat, inserting them one by one fragments the frame
+    # (columns that already exist only ever get assigned to themselves and are skipped)
+    columns = {name: values for name, values in columns.items() if name not in df.columns}
+    if not columns:
+        return df
 
+    names = df.columns.names
+    df = pd.concat([df, pd.DataFrame(columns, index=df.index)], axis=1)
+    df.columns = df.columns.set_names(names)
     return df
 
 
@@ -87,54 +156,93 @@ def create_multi_index(columns):
     return pd.MultiIndex.from_tuples(level_names, names=['indicator', 'level', 'gender'])
 
 
-def get_education_data():
-    PATH = DATA_PATH / 'world_bank' / 'API_4_DS2_en_csv_v2_3160069.csv'
+def iter_education_chunks(codes, years, chunksize=EDUCATION_CHUNK_ROWS):
+    # chunks of the World Bank CSV rows of the indicator `codes` with their `years` values, lines of
+    # other indicators are skipped by a text match before they are parsed, so at most `chunksize`
+    # lines are held no matter how many indicators the file contains
+    PATH = EDUCATION_DATA_PATH
+
+    match = re.compile('|'.join(f'"{re.escape(code)}",' for code in codes).encode()).search
+    dtype = {str(year): 'float64' for year in years}
+    with open(PATH, 'rb') as file:
+        for _ in range(4):
+            next(file)
+        header = next(file)
+        lines = []
+        for line in itertools.chain(file, [None]):
+            if line is not None and match(line):
+                lines.append(line)
+            if lines and (len(lines) == chunksize or line is None):
+                chunk = pd.read_csv(io.BytesIO(header + b''.join(lines)), usecols=['Country Code', 'Indicator Code', *dtype],
+                                    dtype=dtype)
+                lines = []
+                yield chunk[chunk['Indicator Code'].isin(codes)]
+
+
+@timed('dashboard_loader_seconds', 'loader')
+def read_education_source(chunksize=EDUCATION_CHUNK_ROWS):
+    # (country_code, year) x indicator values of the selected indicators, every chunk of the wide CSV
+    # is melted into a preallocated country x year x indicator array (grown by doubling for new countries)
+    PATH = EDUCATION_DATA_PATH
 
-    df = pd.read_csv(PATH, skiprows=4)
     indicators = get_education_indicators()
+    years = [int(column) for column in pd.read_csv(PATH, skiprows=4, nrows=0).columns if column.isdigit()]
+    columns = pd.Index(sorted(indicators.unique()), name='indicator')
+    indicator_positions = pd.Series(columns.get_indexer(indicators.values), index=indicators.index)
 
-    df = df.rename(columns={
-        'Country Code': 'country_code',
-        'Country Name': 'country_name',
-        'Indicator Code': 'indicator_code'
-    })
+    countries = {}
+    values = np.full((256, len(years), len(columns)), np.nan)
+    for chunk in iter_education_chunks(indicators.index, years, chunksize):
+        rows = [countries.setdefault(code, len(countries)) for code in chunk['Country Code']]
+        while len(countries) > len(values):
+            values = np.concatenate([values, np.full_like(values, np.nan)])
+        values[rows, :, indicator_positions[chunk['Indicator Code']].values] = chunk.iloc[:, 2:].to_numpy()
 
-    df = df.drop(columns=['Unnamed: 65', 'Indicator Name', 'country_name'])
+    # countries in sorted order, one row per (country_code, year) like a pivot of the long frame
+    order = sorted(countries)
+    values = values[[countries[code] for code in order]].reshape(len(order) * len(years), len(columns))
+    index = pd.MultiIndex.from_product([order, years], names=['country_code', 'year'])
 
-    df = df.melt(id_vars=['country_code', 'indicator_code'], var_name='year')
-    df.year = df.year.astype(int)
+    return pd.DataFrame(values, index=index, columns=columns)
 
-    df = df.join(indicators, on='indicator_code', how='right')
-    df = df.drop(columns=['indicator_code'])
-    df = df.pivot(index=['country_code', 'year'], columns='indicator', values='value')
+
+@timed('dashboard_loader_seconds', 'loader')
+def get_education_data(df=None):
+    if df is None:
+        df = read_education_source()
 
     levels = ['primary', 'secondary', 'tertiary', 'total']
     genders = ['male', 'female', 'total']
+    columns = {}
     for gender in genders:
         cols = [f'completion_rate_{level}_{gender}' for level in levels[:-1]]
-        df[f'completion_rate_total_{gender}'] = df[cols].mean(axis=1)
+        columns[f'completion_rate_total_{gender}'] = df[cols].mean(axis=1)
     for gender in genders[:-1]:
-        df[f'compulsory_education_duration_total_{gender}'] = df['compulsory_education_duration_total_total']
+        columns[f'compulsory_education_duration_total_{gender}'] = df['compulsory_education_duration_total_total']
     for level in levels:
         for gender in genders:
-            df[f'education_expenditure_gdp_rate_{level}_{gender}'] = df['education_expenditure_gdp_rate_total_total']
+            columns[f'education_expenditure_gdp_rate_{level}_{gender}'] = df['education_expenditure_gdp_rate_total_total']
 
     for level in levels[0:2]:
-        df[f'education_pupils_rate_{level}_total'] = 100
-        df[f'education_pupils_rate_{level}_male'] = 100 - df[f'education_pupils_rate_{level}_female']
+        rates = {'female': df[f'education_pupils_rate_{level}_female']}
+        rates['male'] = 100 - rates['female']
+        columns[f'education_pupils_rate_{level}_total'] = 100
+        columns[f'education_pupils_rate_{level}_male'] = rates['male']
         for gender in genders[:-1]:
-            df[f'education_pupils_{level}_{gender}'] = df[f'education_pupils_{level}_total'] * df[f'education_pupils_rate_{level}_{gender}'] / 100
+            columns[f'education_pupils_{level}_{gender}'] = df[f'education_pupils_{level}_total'] * rates[gender] / 100
 
     for level in levels[:-1]:
         for gender in genders[:-1]:
-            df[f'expenditure_per_student_rate_{level}_{gender}'] = df[f'expenditure_per_student_rate_{level}_total']
-            df[f'expenditure_rate_{level}_{gender}'] = df[f'expenditure_rate_{level}_total']
+            columns[f'expenditure_per_student_rate_{level}_{gender}'] = df[f'expenditure_per_student_rate_{level}_total']
+            columns[f'expenditure_rate_{level}_{gender}'] = df[f'expenditure_rate_{level}_total']
+    df = add_columns(df, columns)
 
     df.columns = create_multi_index(df.columns)
 
     return df
 
 
+@timed('dashboard_loader_seconds', 'loader')
 def get_indicator_desc():
     PATH = DATA_PATH / 'world_bank' / 'Metadata_Indicator_API_4_DS2_en_csv_v2_3160069.csv'
 
@@ -146,11 +254,20 @@ def get_indicator_desc():
     return df
 
 
-def get_hlo_data():
-    PATH = DATA_PATH / 'world_bank' / 'hlo_database.xlsx'
+@timed('dashboard_loader_seconds', 'loader')
+def read_hlo_source():
+    PATH = HLO_DATA_PATH
+
+    return pd.read_excel(
+        PATH,
+        sheet_name='HLO Database',
+        usecols=['code', 'year', 'subject', 'level', 'hlo', 'hlo_m', 'hlo_f'],
+        dtype={'year': 'int64', 'hlo': 'float64', 'hlo_m': 'float64', 'hlo_f': 'float64'})
 
-    df = pd.read_excel(PATH, sheet_name='HLO Database')
-    df = df.drop(columns=['country', 'sourcetest', 'n_res', 'hlo_se', 'hlo_m_se', 'hlo_f_se', 'region', 'incomegroup'])
+
+@timed('dashboard_loader_seconds', 'loader')
+def get_hlo_data():
+    df = read_source('hlo')
     df = df.rename(columns={'code': 'country_code'})
     df = df.set_index(['country_code', 'year', 'subject', 'level'])
     df = df.groupby(['country_code', 'year', 'level']).mean()
@@ -179,11 +296,20 @@ def get_hlo_data():
     return df
 
 
-def get_gdp_data():
-    PATH = DATA_PATH / 'maddison' / 'mpd2020.xlsx'
+@timed('dashboard_loader_seconds', 'loader')
+def read_gdp_source():
+    PATH = GDP_DATA_PATH
 
-    df = pd.read_excel(PATH, sheet_name='Full data')
-    df = df.drop(columns=['country'])
+    return pd.read_excel(
+        PATH,
+        sheet_name='Full data',
+        usecols=['countrycode', 'year', 'gdppc', 'pop'],
+        dtype={'year': 'int64', 'gdppc': 'float64', 'pop': 'float64'})
+
+
+@timed('dashboard_loader_seconds', 'loader')
+def get_gdp_data():
+    df = read_source('maddison')
     df = df.rename(columns={'countrycode': 'country_code', 'pop': 'population'})
     df = df.set_index(['country_code', 'year'])
 
@@ -191,35 +317,290 @@ def get_gdp_data():
 
     levels = ['primary', 'secondary', 'tertiary', 'total']
     genders = ['male', 'female', 'total']
+    columns = {}
     for level in levels:
         for gender in genders:
-            df[('gdppc', level, gender)] = df[('gdppc', 'total', 'total')]
-            df[('population', level, gender)] = df[('population', 'total', 'total')]
+            columns[('gdppc', level, gender)] = df[('gdppc', 'total', 'total')]
+            columns[('population', level, gender)] = df[('population', 'total', 'total')]
+    df = add_columns(df, columns)
 
     return df
 
 
-def get_merged_data(from_year=2000, ffill=True, indexed=True, year_as_datetime=False, multi_index=False):
-    df = get_education_data()
-    edu_meta = get_education_meta(multi_index)
-    hlo = get_hlo_data()
-    gdp = get_gdp_data()
+# sources that are slow to parse and get converted to Parquet by `python data.py ingest`
+INGESTED_SOURCES = {
+    'hlo': (HLO_DATA_PATH, read_hlo_source),
+    'maddison': (GDP_DATA_PATH, read_gdp_source),
+}
+
+
+def ingested_path(name):
+    path, _ = INGESTED_SOURCES[name]
+    return STORE_PATH / f'{name}_{source_fingerprint([path])}.parquet'
+
+
+def ingest_sources():
+    STORE_PATH.mkdir(exist_ok=True)
+    for name, (_, read) in INGESTED_SOURCES.items():
+        for outdated in STORE_PATH.glob(f'{name}_*.parquet'):
+            outdated.unlink(missing_ok=True)
+        read().to_parquet(ingested_path(name), index=False)
+
+
+def read_source(name):
+    # the ingested Parquet file if it matches the current raw file, otherwise the raw file
+    path = ingested_path(name)
+    if path.exists():
+        return pd.read_parquet(path)
+    _, read = INGESTED_SOURCES[name]
+    return read()
+
+
+def source_fingerprint(paths=MERGED_SOURCES):
+    fingerprint = hashlib.sha1()
+    for path in paths:
+        stat = path.stat()
+        fingerprint.update(f'{path.name}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+    return fingerprint.hexdigest()[:16]
+
+
+def partition_by_year(df):
+    # year -> country indexed frame, built once so a year lookup is a dict access
+    return {year: frame.droplevel('year') for year, frame in df.groupby(level='year')}
+
+
+def aggregate_by_group(df, group, weight=None):
+    # (group, year) means of all numeric columns, optionally weighted by the column `weight`
+    numeric = df.select_dtypes('number')
+    keys = [df[group], df.index.get_level_values('year')]
+    if weight is None:
+        return numeric.groupby(keys).mean()
+
+    weights = numeric[weight]
+    weighted_sum = numeric.mul(weights, axis=0).groupby(keys).sum(min_count=1)
+    weight_sum = numeric.notna().mul(weights, axis=0).groupby(keys).sum()
+    return weighted_sum / weight_sum
+
+
+class LongData():
+    # long storage of the merged frame: one float32 value per (country, year, indicator, level, gender)
+    # with categorical keys, sorted so every (indicator, level, gender) is a contiguous block
+    def __init__(self, df):
+        numeric = df.select_dtypes('number')
+        meta = df.select_dtypes(exclude='number')
+        self.index = df.index
+        self.meta = meta.groupby(level='country_code').first()
+
+        # level/gender copies of a column (e.g. gdppc for every level) are stored once and resolved on lookup
+        self.keys = {}
+        stored = {}
+        for column, key in zip(numeric.columns, create_multi_index(numeric.columns)):
+            digest = hashlib.sha1(numeric[column].to_numpy().tobytes()).hexdigest()
+            first = stored.setdefault(digest, column)
+            self.keys[column] = key if first == column else self.keys[first]
+        columns = list(stored.values())
+
+        values = numeric[columns].set_axis(pd.MultiIndex.from_tuples(
+            [self.keys[column] for column in columns], names=['indicator', 'level', 'gender']), axis=1)
+        values = values.stack(['indicator', 'level', 'gender']).astype('float32').rename('value').reset_index()
+        for key in ['country_code', 'year', 'indicator', 'level', 'gender']:
+            values[key] = values[key].astype('category')
+        self.values = values.sort_values(['indicator', 'level', 'gender', 'year', 'country_code'], ignore_index=True)
+        # plain arrays of the sorted rows for the lookups
+        self.value_array = self.values.value.values
+        self.country_codes = self.values.country_code.cat.codes.values
+        self.year_codes = self.values.year.cat.codes.values
+
+        blocks = self.values.groupby(['indicator', 'level', 'gender'], observed=True).indices
+        self.blocks = {key: (positions[0], positions[-1] + 1) for key, positions in blocks.items()}
+
+    def memory_usage(self):
+        return self.values.memory_usage(deep=True).sum() + self.meta.memory_usage(deep=True).sum()
+
+    def block(self, column, year=None):
+        # rows of a flat column (of one year: binary search in the year sorted block)
+        start, stop = self.blocks.get(self.keys[column], (0, 0))
+        if year is not None:
+            code = self.values.year.cat.categories.get_loc(year)
+            start, stop = start + np.searchsorted(self.year_codes[start:stop], [code, code + 1])
+        return start, stop
+
+    def positions(self, index):
+        # position in `index` of every (country, year) category code pair, -1 where `index` has no row
+        countries = self.values.country_code.cat.categories.get_indexer(index.get_level_values('country_code'))
+        years = self.values.year.cat.categories.get_indexer(index.get_level_values('year'))
+        table = np.full((len(self.values.country_code.cat.categories), len(self.values.year.cat.categories)), -1)
+        known = (countries >= 0) & (years >= 0)
+        table[countries[known], years[known]] = np.arange(len(index))[known]
+        return table
+
+    def frame(self, index, columns, year=None):
+        # wide frame of the flat `columns` for the (country_code, year) rows in `index`, the values are
+        # scattered from the column blocks (only the rows of `year`, when given) to their positions
+        table = self.positions(index)
+        data = {}
+        for column in dict.fromkeys(columns):
+            if column in self.keys:
+                start, stop = self.block(column, year)
+                rows = table[self.country_codes[start:stop], self.year_codes[start:stop]]
+                found = rows >= 0
+                data[column] = np.full(len(index), np.nan)
+                data[column][rows[found]] = self.value_array[start:stop][found]
+            elif column in self.meta.columns:
+                data[column] = self.meta[column].reindex(index.get_level_values('country_code')).values
+        return pd.DataFrame(data, index=index)
+
+    def year_frame(self, year, columns):
+        index = self.index[self.index.get_level_values('year') == year]
+        return self.frame(index, columns, year).droplevel('year')
+
+    def countries_frame(self, countries, columns):
+        index = self.index[self.index.get_level_values('country_code').isin(countries)]
+        return self.frame(index, columns)
+
+
+@timed('dashboard_loader_seconds', 'loader')
+def get_merged_data(from_year=2000, ffill=True, indexed=True, year_as_datetime=False, multi_index=False, cache=True,
+                    parallel=False, ffill_limit=None):
+    if not cache:
+        return build_merged_data(from_year, ffill, indexed, year_as_datetime, multi_index, parallel, ffill_limit)
+
+    # cache files are named <arguments>_<other sources>_<education source>, so a new World Bank release
+    # (with the other sources unchanged) finds the previous dataset and only merges what changed
+    arguments = hashlib.sha1(repr((from_year, ffill, year_as_datetime, multi_index, ffill_limit)).encode()).hexdigest()[:16]
+    others = source_fingerprint([path for path in MERGED_SOURCES if path != EDUCATION_DATA_PATH])
+    education = source_fingerprint([EDUCATION_DATA_PATH])
+    path = CACHE_PATH / f'merged_{arguments}_{others}_{education}.parquet'
+    if path.exists():
+        return pd.read_parquet(path)
+
+    sources = load_sources(multi_index, parallel)
+    df = None
+    for outdated in CACHE_PATH.glob(f'merged_{arguments}_{others}_*.parquet'):
+        previous = outdated.with_name(outdated.name.replace(f'merged_{arguments}_', 'education_'))
+        if previous.exists():
+            df = refresh_merged_data(pd.read_parquet(outdated), pd.read_parquet(previous), sources, from_year, ffill,
+                                     year_as_datetime, multi_index, ffill_limit)
+            break
+    if df is None:
+        df = merge_sources(sources, from_year, ffill, year_as_datetime, multi_index, ffill_limit)
+
+    CACHE_PATH.mkdir(exist_ok=True)
+    for outdated in CACHE_PATH.glob(f'merged_{arguments}_*.parquet'):
+        outdated.unlink(missing_ok=True)
+    # write to a temporary file first so concurrent readers never see a partial file
+    write_parquet(df, path)
+
+    # the education source of the cached datasets, the next release is compared against it
+    write_parquet(sources[0], CACHE_PATH / f'education_{others}_{education}.parquet')
+    cached = {'_'.join(merged.stem.split('_')[2:]) for merged in CACHE_PATH.glob('merged_*.parquet')}
+    for outdated in CACHE_PATH.glob('education_*.parquet'):
+        if outdated.stem.replace('education_', '') not in cached:
+            outdated.unlink(missing_ok=True)
+
+    return df
+
+
+def write_parquet(df, path):
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    df.to_parquet(tmp_path)
+    tmp_path.replace(path)
+
+
+def load_sources(multi_index=False, parallel=False):
+    loaders = [read_education_source, partial(get_education_meta, multi_index), get_hlo_data, get_gdp_data]
+    if not parallel or (os.cpu_count() or 1) < 2:
+        return [loader() for loader in loaders]
+
+    # the sources are independent, parsing them in separate processes bounds the
+    # load time by the slowest source (the Excel files) instead of the sum of all
+    with ProcessPoolExecutor(max_workers=len(loaders)) as executor:
+        futures = [executor.submit(loader) for loader in loaders]
+        return [future.result() for future in futures]
+
+
+def changed_countries(previous, current):
+    # countries with a (country, year) row that was added, removed or changed between two education sources
+    previous, current = previous.align(current, join='outer')
+    changed = (previous != current) & (previous.notna() | current.notna())
+    rows = changed.any(axis=1)
+    return rows[rows].index.get_level_values('country_code').unique()
+
+
+def refresh_merged_data(df, previous, sources, from_year=2000, ffill=True, year_as_datetime=False, multi_index=False,
+                        ffill_limit=None):
+    # every step of the merge only works within a country, so the rows (and forward fill) of the countries
+    # with new or changed education values are rebuilt and the rows of all other countries are kept
+    education, *others = sources
+    countries = changed_countries(previous, education)
+    if countries.empty:
+        return df
+
+    education = education[education.index.get_level_values('country_code').isin(countries)]
+    update = merge_sources([education, *others], from_year, ffill, year_as_datetime, multi_index, ffill_limit)
+    df = df[~df.index.get_level_values('country_code').isin(countries)]
+
+    return pd.concat([df, update]).sort_index()
+
+
+def build_merged_data(from_year=2000, ffill=True, indexed=True, year_as_datetime=False, multi_index=False,
+                      parallel=False, ffill_limit=None):
+    sources = load_sources(multi_index, parallel)
+    return merge_sources(sources, from_year, ffill, year_as_datetime, multi_index, ffill_limit)
+
+
+def ffill_years(df, limit=None):
+    # forward fill every column of each country along the years over a dense (column, country) x year
+    # array, values are carried at most `limit` years (rows missing from `df` count as years without
+    # a value), only float columns can have gaps, the others (integer) are kept as they are
+    countries = df.index.get_level_values('country_code')
+    years = df.index.get_level_values('year')
+    dense = pd.MultiIndex.from_product(
+        [countries.unique().sort_values(), np.arange(years.min(), years.max() + 1)], names=['country_code', 'year'])
+    floats = [dtype.kind == 'f' for dtype in df.dtypes]
+    frame = df.loc[:, floats] if df.index.equals(dense) else df.loc[:, floats].reindex(dense)
+    values = frame.to_numpy(copy=True).T.reshape(-1, len(dense.levels[1]))
+
+    # years since the last value of every row, only needed for the limit
+    stale = np.zeros(len(values), dtype='int32')
+    for year in range(1, values.shape[1]):
+        missing = np.isnan(values[:, year])
+        if limit is not None:
+            stale += 1
+            stale *= missing
+            missing &= stale <= limit
+        np.copyto(values[:, year], values[:, year - 1], where=missing)
+
+    filled = pd.DataFrame(values.reshape(len(frame.columns), len(dense)).T, index=dense, columns=frame.columns)
+    if not filled.index.equals(df.index):
+        filled = filled.reindex(df.index)
+    for position, (column, is_float) in enumerate(zip(df.columns, floats)):
+        if not is_float:
+            filled.insert(position, column, df[column].to_numpy())
+    return filled
+
+
+def merge_sources(sources, from_year=2000, ffill=True, year_as_datetime=False, multi_index=False, ffill_limit=None):
+    education, edu_meta, hlo, gdp = sources
+    df = get_education_data(education)
 
     df = df.join(hlo)
     df = df.join(gdp, on=['country_code', 'year'])
 
-    df[('education_spent', 'total', 'total')] = df[('gdppc', 'total', 'total')] * df[('education_expenditure_gdp_rate', 'total', 'total')] /  100
+    education_spent = df[('gdppc', 'total', 'total')] * df[('education_expenditure_gdp_rate', 'total', 'total')] /  100
     levels = ['primary', 'secondary', 'tertiary', 'total']
     genders = ['male', 'female', 'total']
+    columns = {('education_spent', 'total', 'total'): education_spent}
     for level in levels:
         for gender in genders:
-            df[('education_spent', level, gender)] = df[('education_spent', 'total', 'total')]
+            columns[('education_spent', level, gender)] = education_spent
+    df = add_columns(df, columns)
 
     if ffill:
-        df = df.sort_index(level='year')
-        df = df.groupby(['country_code']).ffill()
+        df = ffill_years(df, ffill_limit)
 
-    df = df[df.index.isin([year for year in range(from_year, 2021)], level='year')]
+    years = df.index.get_level_values('year')
+    df = df[(years >= from_year) & (years <= 2020)]
     if year_as_datetime:
         df.index = df.index.set_levels([df.index.levels[0], pd.to_datetime(df.index.levels[1], format='%Y')])
 
@@ -232,6 +613,12 @@ def get_merged_data(from_year=2000, ffill=True, indexed=True, year_as_datetime=F
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the merged data or ingest the raw sources.')
+    parser.add_argument('command', nargs='?', choices=['export', 'ingest'], default='export')
+    if parser.parse_args().command == 'ingest':
+        ingest_sources()
+        sys.exit()
+
     df = get_merged_data(year_as_datetime=False)
     df.to_csv(DATA_PATH / 'data.csv')
 
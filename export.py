@@ -0,0 +1,157 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+import bokeh
+from bokeh.core.json_encoder import serialize_json
+from bokeh.embed import file_html, json_item
+from bokeh.models import Column, Div, Select, Slider
+from bokeh.resources import CDN
+import store
+from config import Config
+
+APP_PATH = Path(__file__).parent
+EXPORT_PATH = APP_PATH / 'export'
+
+# the dashboard document of a worker process, built once and set to every state it renders
+_worker = {}
+
+
+def create_static_document():
+    # the widgets are hidden since static pages cannot run them and a caption names the exported state instead
+    doc = store.create_document()
+
+    slider = doc.select_one({'type': Slider})
+    selects = {select.title: select for select in doc.select({'type': Select})}
+    tools = next(model for model in doc.models if isinstance(model, Column) and slider in model.children)
+    for widget in tools.children:
+        widget.visible = False
+    caption = Div()
+    tools.children = [caption] + tools.children
+
+    widgets = {'year': slider, 'indicator': selects['Indicator:'], 'by': selects['By:']}
+    return doc, widgets, caption
+
+
+def has_options(indicator, by):
+    # some combinations leave no education level (or gender) to select, the dashboard cannot show them
+    return all(
+        set(options) - set(Config.INDICATORS[indicator][f'{type}_not_present']) - set(Config.BY[by][f'{type}_not_present'])
+        for type, options in [('level', Config.LEVELS), ('gender', Config.GENDER)]
+    )
+
+
+def init_worker():
+    _worker['document'] = create_static_document()
+
+
+def state_key(root):
+    # hash of every property (defaults included) of the models reachable from `root`, with their ids
+    # numbered in the order they are reached, bokeh's ids and reference order depend on the states a
+    # worker rendered before, the key only on the rendered state (and the bokeh version)
+    models = {model.id: model for model in root.references()}
+    ids = {root.id: '0'}
+    pending = [root]
+
+    def canonical(value):
+        if isinstance(value, dict):
+            if list(value) == ['id'] and value['id'] in models:
+                if value['id'] not in ids:
+                    ids[value['id']] = str(len(ids))
+                    pending.append(models[value['id']])
+                return {'id': ids[value['id']]}
+            return {key: canonical(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [canonical(item) for item in value]
+        return value
+
+    content = []
+    while pending:
+        model = pending.pop(0)
+        properties = model.to_json(include_defaults=True)
+        del properties['id']
+        content.append([model.__view_model__, canonical(properties)])
+    return hashlib.sha256(serialize_json([bokeh.__version__, content]).encode()).hexdigest()[:20]
+
+
+def write_content(content, name, output):
+    # files are named by the key of their state, so a CDN can cache them forever and an unchanged state
+    # keeps its urls across exports (the file of an earlier export is kept, its ids differ)
+    path = output / name
+    if not path.exists():
+        tmp = path.with_name(f'{name}.{os.getpid()}.tmp')
+        tmp.write_text(content)
+        os.replace(tmp, path)
+    return name
+
+
+def render(state, output, formats):
+    doc, widgets, caption = _worker['document']
+    year, indicator, by = state
+    # the indicator and by selects reset level, gender and the log scale like in the live dashboard,
+    # they are set in the order that does not pass through a combination without options
+    if has_options(indicator, widgets['by'].value):
+        widgets['indicator'].value = indicator
+        widgets['by'].value = by
+    else:
+        widgets['by'].value = by
+        widgets['indicator'].value = indicator
+    widgets['year'].value = year
+    caption.text = f'<b>{year}</b><br>{indicator.replace("_", " ").title()}<br>by {by.replace("_", " ")}'
+
+    files = {'year': int(year), 'indicator': indicator, 'by': by}
+    key = state_key(doc.roots[0])
+    if 'html' in formats:
+        files['html'] = write_content(file_html(doc.roots[0], CDN, 'World Education Dashboard'), f'{key}.html', output)
+    if 'json' in formats:
+        files['json'] = write_content(json.dumps(json_item(doc.roots[0])), f'{key}.json', output)
+    return files
+
+
+def manifest_files(path):
+    if not path.exists():
+        return set()
+    return {name for entry in json.loads(path.read_text()) for name in [entry.get('html'), entry.get('json')] if name}
+
+
+def export(output=EXPORT_PATH, years=None, formats=('html', 'json'), workers=None):
+    # every year, indicator and by option with the default level, gender and grouping the dashboard
+    # switches to for them (the other variants are not exported)
+    df, _ = store.get_data()
+    dates = [year for year in Config(df).DATES if not years or year in years]
+    states = [state for state in product(dates, Config.INDICATORS, Config.BY) if has_options(*state[1:])]
+    output.mkdir(parents=True, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    if workers < 2:
+        init_worker()
+        files = [render(state, output, formats) for state in states]
+    else:
+        # the datasets are loaded before the workers start, forked workers share them
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            futures = [executor.submit(render, state, output, formats) for state in states]
+            files = [future.result() for future in futures]
+
+    # the manifest is the only file that is overwritten, files of the previous export (listed in its
+    # manifest) that are no longer referenced are removed, other files in the directory are left alone
+    manifest = output / 'manifest.json'
+    previous = manifest_files(manifest)
+    manifest.write_text(json.dumps(files, indent=2))
+    for name in previous - manifest_files(manifest):
+        (output / name).unlink(missing_ok=True)
+    return files
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render the dashboard for every year, indicator and by option.')
+    parser.add_argument('--output', type=Path, default=EXPORT_PATH, help='directory of the exported files')
+    parser.add_argument('--years', type=int, nargs='*', help='only export these years')
+    parser.add_argument('--formats', nargs='+', choices=['html', 'json'], default=['html', 'json'])
+    parser.add_argument('--workers', type=int, help='worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    files = export(args.output, args.years, args.formats, args.workers)
+    print(f'exported {len(files)} states to {args.output}')
@@ -0,0 +1,1022 @@
+from bokeh.transform import factor_cmap
+from bokeh.models import Legend, LegendItem, LinearColorMapper, CategoricalColorMapper
+from bokeh.models import FactorRange, LinearAxis, LinearScale, LogAxis, LogScale
+from bokeh.palettes import Category10, Category20, Blues9
+from bokeh.layouts import column, row, layout
+from bokeh.models import ColumnDataSource, Slider, Select, ColorBar, CheckboxGroup, CustomJS, HoverTool
+from bokeh.plotting import figure, curdoc
+from bokeh.document import without_document_lock
+from bokeh.document.events import ModelChangedEvent
+from bokeh.events import SelectionGeometry
+from bokeh.protocol import Protocol
+from bokeh.core.properties import value
+from bokeh.transform import dodge
+import asyncio
+import logging
+import sys
+import time
+from collections import namedtuple
+from functools import partial
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point, Polygon, box
+from store import cached, get_data, get_executor, get_geo_patches, get_geo_positions, query_geo, get_year, get_countries
+from store import get_range, get_group_means
+from metrics import observe, timed, timer, track_session
+from config import Config
+
+log = logging.getLogger('dashboard')
+
+# datasets are loaded once per process and shared (read-only) by all sessions
+df, df_geo = get_data()
+
+settings = Config(df)
+
+
+# define helper functions:
+def color_by_group(group, group_by=None):
+    if not group_by:
+        group_by = select_group.value
+    color_mapper = CategoricalColorMapper(
+        palette=Category10[len(settings.GROUPS[group_by])],
+        factors=settings.GROUPS[group_by]
+    )
+    return color_mapper.palette[color_mapper.factors.index(group)]
+
+
+def group_cmap():
+    return factor_cmap(
+        field_name=select_group.value,
+        palette=Category10[len(settings.GROUPS[select_group.value])],
+        factors=settings.GROUPS[select_group.value])
+
+
+def group_legend_items(renderer, group):
+    # one item per group pointing to its first row (what legend_group creates)
+    groups, index = np.unique(renderer.data_source.data[group], return_index=True)
+    return [LegendItem(label=value(str(name)), renderers=[renderer], index=i) for name, i in zip(groups, index)]
+
+
+def update_glyphs(renderer, **properties):
+    # keep the hover and selection variants of a glyph in sync with the glyph itself
+    for glyph in [renderer.glyph, renderer.hover_glyph, renderer.selection_glyph, renderer.nonselection_glyph]:
+        if glyph is not None and not isinstance(glyph, str):
+            glyph.update(**properties)
+
+
+def color_sequential(n, i):
+    if n < 10:
+        colors = Category10[10]
+        return colors[i % 10]
+    else:
+        colors = Category20[20]
+        return colors[i % 20]
+
+
+def indicator_col(indicator=None, level=None, gender=None):
+    if not indicator:
+        indicator = select_indicator.value
+    if not level:
+        level = select_level.value
+    if not gender:
+        gender = select_gender.value
+    return '_'.join([indicator, level, gender])
+
+
+def field(column):
+    # in the client mode sources hold every year, glyphs read the column of the selected year
+    if settings.CLIENT_UPDATES:
+        return f'{column}:{slider_year.value}'
+    return column
+
+
+def line_field(column):
+    return f'ys:{column}' if settings.CLIENT_UPDATES else 'ys'
+
+
+class WidgetState(namedtuple('WidgetState', [
+        'year', 'indicator', 'by', 'level', 'gender', 'group', 'weighted', 'levels', 'genders',
+        'selected', 'countries', 'source_columns', 'geo_columns'])):
+    # the widget values (and level/gender options) and what the sources hold, read under the document
+    # lock when a callback runs, its data work in the executor only reads this snapshot (see submit)
+    def column(self, indicator=None, level=None, gender=None):
+        return '_'.join([indicator or self.indicator, level or self.level, gender or self.gender])
+
+
+def widget_state():
+    return WidgetState(
+        year=slider_year.value,
+        indicator=select_indicator.value,
+        by=select_by.value,
+        level=select_level.value,
+        gender=select_gender.value,
+        group=select_group.value,
+        weighted=1 in checkbox_group.active,
+        levels=tuple(option for option, _ in select_level.options),
+        genders=tuple(option for option, _ in select_gender.options),
+        selected=tuple(source.selected.indices),
+        countries=source.data.get('country_code', []),
+        source_columns=frozenset(source.data),
+        geo_columns=list(geo_source.tags),
+    )
+
+
+def variant_columns(state, indicator):
+    # the indicator's columns of every level and gender that can be selected
+    return [state.column(indicator, level, gender) for level in state.levels for gender in state.genders]
+
+
+def all_years(data, columns):
+    # (row, year) indexed values to one column per column and year, the fields of the client mode
+    wide = data[[column for column in columns if column in data.columns]].unstack('year').astype('float32')
+    wide.columns = [f'{column}:{year}' for column, year in wide.columns]
+    return wide
+
+
+def select_range(config, indicator, level=None, gender=None):
+    if config[indicator]['range'] == 'rate':
+        return 0, 105
+
+    min, max = get_range(indicator_col(indicator, level, gender), settings.ROBUST_RANGES)
+    return min * 0.9, max * 1.1
+
+
+def format_label(indicator, x_label=False):
+    words = indicator.split('_')
+    formatted = ' '.join([word.capitalize() for word in words])
+    if x_label:
+        if 0 in checkbox_group.active:
+            formatted = 'log ' + formatted
+    return formatted
+
+
+def create_slider_widget(title, options):
+    return Slider(
+        title=title,
+        value=options[-1],
+        start=options[0],
+        end=options[-1],
+        step=1
+    )
+
+
+def create_select_widget(title, options):
+    value = options[0]
+    return Select(
+        title=title,
+        value=value,
+        options=format_options(options)
+    )
+
+
+def create_checkbox_widget(labels, active):
+    return CheckboxGroup(
+        labels=labels,
+        active=active
+    )
+
+
+def create_options(type, options):
+    restricted_options = options.copy()
+    for value in settings.INDICATORS[select_indicator.value][f'{type}_not_present']:
+        if value in restricted_options:
+            restricted_options.remove(value)
+    for value in settings.BY[select_by.value][f'{type}_not_present']:
+        if value in restricted_options:
+            restricted_options.remove(value)
+    return restricted_options
+
+
+def format_options(options):
+    return [(option, format_label(option)) for option in options]
+
+
+def group_means(state, year=None):
+    return get_group_means(state.group, year, weighted=state.weighted)
+
+
+def project(data, columns):
+    # only the columns referenced by glyphs and tooltips are sent to the browser
+    # (columns of an option that is about to be replaced in the widgets are skipped)
+    return data[[column for column in dict.fromkeys(columns) if column in data.columns]]
+
+
+def scatter_columns(state):
+    # glyph fields, color group and the tooltip columns (see create_tooltips)
+    indicator, by = state.column(), state.column(state.by)
+    return [by, indicator, state.group, 'country_name', indicator, by]
+
+
+def scatter_data(year, columns):
+    return ColumnDataSource.from_df(project(get_year(year, columns), columns))
+
+
+def geo_attributes(year, indicator_column, by_column):
+    # values aligned to the (fixed) order of the map patches, stored under fixed column names
+    # so that another selection never resends the patch coordinates
+    columns = {'country_name': 'country_name', indicator_column: 'indicator', by_column: 'by'}
+    data = project(get_year(year, list(columns)), columns).reindex(df_geo.index).rename(columns=columns)
+    return ColumnDataSource.from_df(data)
+
+
+def client_data(group, columns):
+    # every year of the columns for the scatter (country rows) and the map (patch rows)
+    data = get_countries(df.index.get_level_values('country_code').unique(), [*columns, 'country_name', group])
+    scatter = data[['country_name', group]].groupby(level='country_code').first().join(all_years(data, columns))
+    geo = scatter.drop(columns=group).reindex(df_geo.index)
+    return ColumnDataSource.from_df(scatter), ColumnDataSource.from_df(geo)
+
+
+def client_ranges():
+    # axis ranges of every column the browser can switch to
+    return {
+        indicator_col(name, level, gender): select_range(config, name, level, gender)
+        for config, name in [(settings.INDICATORS, select_indicator.value), (settings.BY, select_by.value)]
+        for level in create_options('level', settings.LEVELS) for gender in create_options('gender', settings.GENDER)
+    }
+
+
+def selection_columns(state):
+    # the bar charts of a selection show every level and gender of the indicator
+    return ['country_name'] + [state.column(level=level, gender=gender) for level in settings.LEVELS for gender in settings.GENDER]
+
+
+def source_data(state, year_changed=False):
+    # new contents of the scatter and map sources, None where a source stays as it is
+    # cached per widget state, the computations only depend on their key
+    if settings.CLIENT_UPDATES:
+        columns = variant_columns(state, state.indicator) + variant_columns(state, state.by)
+        scatter, geo_data = cached(('client', state.group, *columns), partial(client_data, state.group, columns))
+        return None if state.source_columns == set(scatter) else scatter, \
+            None if state.geo_columns == columns else geo_data, columns
+
+    columns = scatter_columns(state)
+
+    scatter = None
+    if year_changed or state.source_columns != {'country_code', *columns}:
+        scatter = cached(('scatter', state.year, *columns), partial(scatter_data, state.year, columns))
+
+    geo_columns = [state.column(), state.column(state.by)]
+    geo_data = None
+    if year_changed or state.geo_columns != geo_columns:
+        geo_data = cached(('geo', state.year, *geo_columns), partial(geo_attributes, state.year, *geo_columns))
+
+    return scatter, geo_data, geo_columns
+
+
+def update_sources(data):
+    scatter_data, geo_data, geo_columns = data
+    if scatter_data is not None:
+        source.data = scatter_data
+    if geo_data is not None:
+        if settings.CLIENT_UPDATES:
+            # the columns differ per indicator, the old ones are dropped with the coordinates resent
+            geo_source.data = dict(geo_data, xs=geo_source.data['xs'], ys=geo_source.data['ys'])
+        else:
+            # only the attribute columns are sent, the xs/ys patch coordinates stay untouched
+            geo_source.data.update(geo_data)
+        geo_source.tags = geo_columns
+
+
+def submit(name, compute, apply):
+    # `compute` does the data work of callback `name` in the executor, `apply` changes the models with
+    # its result under the document lock; a session runs one job at a time and keeps only the latest
+    # request per callback, a running job that was requested again in the meantime is not applied
+    requested = time.perf_counter()
+    compute, apply = timed_job(name, 'compute', compute), timed_job(name, 'apply', apply)
+    if not settings.BACKGROUND_CALLBACKS:
+        apply(compute())
+        observe('dashboard_job_seconds', time.perf_counter() - requested, job=name, stage='total')
+        return
+    jobs['pending'][name] = (compute, apply, requested)
+    if jobs['running'] is None:
+        # the coroutine runs after curdoc() is restored, so it gets the session document passed
+        curdoc().add_next_tick_callback(without_document_lock(partial(run_jobs, curdoc())))
+
+
+def timed_job(name, stage, function):
+    def run(*args):
+        with timer('dashboard_job_seconds', job=name, stage=stage):
+            return function(*args)
+    return run
+
+
+async def run_jobs(doc):
+    # a failed job is logged and skipped, the session keeps running the later ones
+    loop = asyncio.get_running_loop()
+    try:
+        while jobs['pending']:
+            name = next(iter(jobs['pending']))
+            compute, apply, requested = jobs['pending'].pop(name)
+            jobs['running'] = name
+            try:
+                result = await asyncio.wrap_future(get_executor().submit(compute))
+            except Exception:
+                log.exception('computing %s failed', name)
+                continue
+
+            applied = loop.create_future()
+
+            def locked_apply():
+                try:
+                    if name not in jobs['pending']:
+                        apply(result)
+                        observe('dashboard_job_seconds', time.perf_counter() - requested, job=name, stage='total')
+                except Exception:
+                    log.exception('applying %s failed', name)
+                finally:
+                    applied.set_result(None)
+
+            # the next job reads the sources, so it only starts once this result is applied
+            doc.add_next_tick_callback(locked_apply)
+            await applied
+    finally:
+        jobs['running'] = None
+
+
+def throttled(callback):
+    # the first change schedules the callback, later changes only replace its arguments, so at most
+    # one call is pending and it renders the latest state (intermediate values are never computed)
+    if not settings.CALLBACK_THROTTLE:
+        return callback
+    pending = {}
+
+    def run():
+        attr, old, new = pending.pop('args')
+        callback(attr, old, new)
+
+    def schedule(attr, old, new):
+        if 'args' in pending:
+            old = pending['args'][1]
+        else:
+            curdoc().add_timeout_callback(run, settings.CALLBACK_THROTTLE)
+        pending['args'] = (attr, old, new)
+
+    return schedule
+
+
+def geo_resolution(x_range):
+    # coarsest geometry that is still detailed enough for the visible longitude range
+    if x_range.start is None or x_range.end is None:
+        return map_state['resolution']
+    width = abs(x_range.end - x_range.start)
+    for resolution, geometry in enumerate(settings.GEO_RESOLUTIONS):
+        if width >= geometry['min_width']:
+            return resolution
+    return len(settings.GEO_RESOLUTIONS) - 1
+
+
+@timed('dashboard_callback_seconds', 'callback')
+def update_geo_resolution(x_range):
+    resolution = geo_resolution(x_range)
+    if resolution != map_state['resolution']:
+        # swap only the patch coordinates, the attribute columns stay untouched
+        patches = get_geo_patches(resolution)
+        geo_source.data.update({column: patches[column].values for column in ['xs', 'ys']})
+        map_state['resolution'] = resolution
+
+
+def geo_index(selected_countries):
+    return get_geo_positions(selected_countries)
+
+
+def selection_region(geometry):
+    # shapely geometry of a selection on the map (tap point, box or lasso polygon) in map coordinates
+    if geometry['type'] == 'point':
+        return Point(geometry['x'], geometry['y'])
+    if geometry['type'] == 'rect':
+        x0, x1 = sorted([geometry['x0'], geometry['x1']])
+        y0, y1 = sorted([geometry['y0'], geometry['y1']])
+        return box(x0, y0, x1, y1)
+    if geometry['type'] == 'poly' and len(geometry['x']) > 2:
+        # a lasso may cross itself, the buffer makes it a valid polygon
+        return Polygon(zip(geometry['x'], geometry['y'])).buffer(0)
+    return None
+
+
+@timed('dashboard_callback_seconds', 'callback')
+def select_on_map(event):
+    # the countries hit by a map selection are selected in the scatter source, which updates the
+    # lines, bar charts and the map selection like a selection in the scatter plot
+    region = selection_region(event.geometry)
+    if not event.final or region is None:
+        return
+    predicate = 'intersects' if event.geometry['type'] == 'point' else settings.MAP_SELECTION
+    rows = pd.Index(source.data['country_code']).get_indexer(query_geo(region, predicate))
+    source.selected.indices = sorted(rows[rows >= 0].tolist())
+
+
+@timed('dashboard_callback_seconds', 'callback')
+def update_view(attr, old, new):
+    state = widget_state()
+    submit('update_view', lambda: (source_data(state), selection_data(state, state.selected)), apply_view)
+
+
+def apply_view(data):
+    sources, (bars, selected_countries, lines, _) = data
+    update_sources(sources)
+    if settings.INCREMENTAL_UPDATES:
+        # recompute the document's model graph once instead of after every mutation
+        with curdoc().models.freeze():
+            update_choropleth(figures['choropleth'])
+            update_scatter(figures['scatter'])
+            update_line_chart(figures['line_chart'], selected_countries, lines)
+            update_bar_chart_gender(figures['bar_chart_gender'], bars['gender'])
+            update_bar_chart_level(figures['bar_chart_level'], bars['level'])
+            if settings.CLIENT_UPDATES:
+                client_update.args = client_args()
+        return
+    rebuild_view(bars, selected_countries)
+
+
+def rebuild_view(bars, selected_countries):
+    dashboard.children[0].children[0].children[0].children[1] = choropleth()
+    dashboard.children[0].children[0].children[1] = scatter()
+    dashboard.children[0].children[1].children[0] = line_chart(selected_countries)
+    dashboard.children[0].children[1].children[1] = bar_chart_gender(bars['gender'])
+    dashboard.children[0].children[1].children[2] = bar_chart_level(bars['level'])
+
+
+@timed('dashboard_callback_seconds', 'callback')
+def update_by_select(attr, old, new):
+    state = widget_state()
+    submit('update_by_select', lambda: selection_data(state, new), apply_selection)
+
+
+def selection_data(state, indices):
+    columns = selection_columns(state)
+    if settings.CLIENT_UPDATES:
+        # rows of every year for the selected countries (in the order of the scatter source)
+        countries = np.asarray(state.countries)[list(indices)]
+        data = get_countries(countries, columns)
+        data = data[['country_name']].groupby(level='country_code').first() \
+            .join(all_years(data, columns[1:])).reindex(countries).reset_index()
+    else:
+        data = get_year(state.year, columns).iloc[list(indices)].reset_index()
+    selected_countries = data['country_code'].values
+    # no selected country shows the group means
+    bars = bars_data(state, data if len(data) else None)
+    return bars, selected_countries, line_data(state, selected_countries), geo_index(selected_countries)
+
+
+def apply_selection(selection):
+    bars, selected_countries, lines, geo_indices = selection
+    if settings.INCREMENTAL_UPDATES:
+        with curdoc().models.freeze():
+            update_line_chart(figures['line_chart'], selected_countries, lines)
+            update_bar_chart_gender(figures['bar_chart_gender'], bars['gender'])
+            update_bar_chart_level(figures['bar_chart_level'], bars['level'])
+    else:
+        dashboard.children[0].children[1].children[0] = line_chart(selected_countries)
+        dashboard.children[0].children[1].children[1] = bar_chart_gender(bars['gender'])
+        dashboard.children[0].children[1].children[2] = bar_chart_level(bars['level'])
+    geo_source.selected.indices = geo_indices
+
+
+@timed('dashboard_callback_seconds', 'callback')
+def update_data(attr, old, new):
+    # selected countries stay selected, their bar charts and lines (ranked by the year) follow the year
+    state = widget_state()
+    submit('update_data', lambda: (source_data(state, year_changed=True), selection_data(state, state.selected)),
+           apply_data)
+
+
+def apply_data(data):
+    sources, (bars, selected_countries, lines, _) = data
+    update_sources(sources)
+    if settings.INCREMENTAL_UPDATES:
+        # a year change only affects the scatter legend, the bar charts and the lines of a selection
+        # (the group lines span every year)
+        with curdoc().models.freeze():
+            update_scatter(figures['scatter'])
+            if len(selected_countries) > 0:
+                update_line_chart(figures['line_chart'], selected_countries, lines)
+            update_bar_chart_gender(figures['bar_chart_gender'], bars['gender'])
+            update_bar_chart_level(figures['bar_chart_level'], bars['level'])
+        return
+    rebuild_view(bars, selected_countries)
+
+
+@timed('dashboard_callback_seconds', 'callback')
+def update_view_tools(attr, old, new):
+    if settings.BY[select_by.value]['scale'] == 'log':
+        if 0 not in checkbox_group.active:
+            checkbox_group.active.append(0)
+    elif 0 in checkbox_group.active:
+        checkbox_group.active.remove(0)
+    level_options = create_options('level', settings.LEVELS)
+    select_level.options = format_options(level_options)
+    select_level.value = level_options[0]
+    gender_options = create_options('gender', settings.GENDER)
+    select_gender.options = format_options(gender_options)
+    select_gender.value = gender_options[0]
+    update_view(attr, old, new)
+
+
+def create_tooltips(values, fields=None):
+    if not fields:
+        fields = [field(indicator_col(value)) for value in values]
+    tooltips = [(format_label(value), '@{' + name + '}') for value, name in zip(values, fields)]
+    tooltips.insert(0, ('Country', '@country_name'))
+    return tooltips
+
+
+# define widgets
+slider_year = create_slider_widget('Year', settings.DATES)
+select_indicator = create_select_widget('Indicator:', list(settings.INDICATORS.keys()))
+select_by = create_select_widget('By:', list(settings.BY.keys()))
+select_group = create_select_widget('Group by:', settings.GROUP_BY)
+select_level = create_select_widget('Education Level:', create_options('level', settings.LEVELS))
+select_gender = create_select_widget('Gender:', create_options('gender', settings.GENDER))
+checkbox_group = create_checkbox_widget(['Log scale', 'Population weighted'], [0])
+
+# sources are filled with the columns needed for the initial widget state
+source = ColumnDataSource(name='source')
+# the map starts with the coarsest geometry and switches to finer ones when zooming in
+map_state = {'resolution': 0}
+geo_source = ColumnDataSource(ColumnDataSource.from_df(get_geo_patches(map_state['resolution'])), name='geo_source')
+update_sources(source_data(widget_state(), year_changed=True))
+# background jobs of this session (see submit)
+jobs = {'pending': {}, 'running': None}
+
+# add callbacks to widgets (in the client mode year, level and gender are handled by CustomJS below)
+if not settings.CLIENT_UPDATES:
+    slider_year.on_change('value_throttled' if settings.SLIDER_THROTTLED else 'value', throttled(update_data))
+    select_level.on_change('value', update_view)
+    select_gender.on_change('value', update_view)
+select_indicator.on_change('value', update_view_tools)
+select_by.on_change('value', update_view_tools)
+select_group.on_change('value', update_view)
+checkbox_group.on_change('active', update_view)
+source.selected.on_change('indices', throttled(update_by_select))
+
+
+# scatterplot function
+def scatter():
+    fig = figure(
+        height=settings.COL1_HEIGHT,
+        width=settings.COL1_WIDTH,
+        tools='hover,tap,pan,box_zoom,wheel_zoom,zoom_in,zoom_out,lasso_select,save,reset',
+        toolbar_location='above',
+        x_axis_type='log' if 0 in checkbox_group.active else 'linear',
+        y_range=select_range(settings.INDICATORS, select_indicator.value),
+        x_range=select_range(settings.BY, select_by.value))
+    fig.add_layout(Legend(), 'right')
+    fig.title.text = 'Data Explorer'
+    fig.title.align = 'center'
+    fig.title.text_font_size = '20px'
+
+    # create scatterplot
+    fig.scatter(
+        x=field(indicator_col(select_by.value)),
+        y=field(indicator_col(select_indicator.value)),
+        source=source,
+        color=group_cmap(),
+        size=9,
+        hover_line_color='black',
+        fill_alpha=0.5)
+
+    update_scatter(fig)
+
+    return fig
+
+
+def update_scatter(fig):
+    log_scale = 0 in checkbox_group.active
+    if isinstance(fig.x_scale, LogScale) != log_scale:
+        # with the minor ticks figure() gives an axis of the type
+        axis = LogAxis() if log_scale else LinearAxis()
+        axis.ticker.num_minor_ticks = 10 if log_scale else 5
+        fig.x_scale = LogScale() if log_scale else LinearScale()
+        fig.below = [axis]
+        # the grid follows the new axis' ticker, it no longer references (and sends) the replaced axis
+        fig.xgrid.update(axis=axis, ticker=None)
+    fig.y_range.start, fig.y_range.end = select_range(settings.INDICATORS, select_indicator.value)
+    fig.x_range.start, fig.x_range.end = select_range(settings.BY, select_by.value)
+    fig.yaxis.axis_label = format_label(select_indicator.value)
+    fig.xaxis.axis_label = format_label(select_by.value, x_label=True)
+    fig.legend.title = format_label(select_group.value)
+
+    # set tooltips
+    fig.hover.tooltips = create_tooltips([select_indicator.value, select_by.value])
+
+    renderer = fig.renderers[0]
+    update_glyphs(renderer, x=field(indicator_col(select_by.value)), y=field(indicator_col(select_indicator.value)))
+    if renderer.glyph.fill_color['field'] != select_group.value:
+        color = group_cmap()
+        update_glyphs(renderer, fill_color=color)
+        renderer.glyph.line_color = color
+        renderer.nonselection_glyph.line_color = color
+
+    # legend items reference rows of the source, they follow the year and the grouping
+    items = group_legend_items(renderer, select_group.value)
+    legend = fig.legend[0]
+    if [item.label for item in legend.items] == [item.label for item in items]:
+        for item, new_item in zip(legend.items, items):
+            item.index = new_item.index
+    else:
+        legend.items = items
+
+
+# chropleth function
+def choropleth():
+    fig = figure(
+        height=settings.COL1_HEIGHT,
+        width=settings.COL1_WIDTH - settings.TOOL_WIDTH,
+        tools='hover,tap,wheel_zoom,box_zoom,zoom_in,zoom_out,box_select,lasso_select,save,reset',
+        toolbar_location='above',
+        x_axis_location=None,
+        y_axis_location=None)
+    fig.grid.visible = False
+    fig.title.text = 'Difference by Country'
+    fig.title.align = 'center'
+    fig.title.text_font_size = '20px'
+
+    color_mapper = LinearColorMapper(palette=list(reversed(Blues9)))
+
+    fig.patches(
+        xs='xs',
+        ys='ys',
+        source=geo_source,
+        fill_alpha=0.9,
+        fill_color={'field': 'indicator', 'transform': color_mapper},
+        line_color='white',
+        line_width=0.3,
+        hover_line_color='black',
+    )
+
+    color_bar = ColorBar(
+        color_mapper=color_mapper,
+        location='bottom_left', orientation='horizontal',
+        title_text_font_size='14px', title_text_font_style='bold',
+        scale_alpha=0.9,
+        background_fill_alpha=0.0)
+    fig.add_layout(color_bar)
+
+    for attr in ['start', 'end']:
+        fig.x_range.on_change(attr, lambda attr, old, new: update_geo_resolution(fig.x_range))
+    fig.on_event(SelectionGeometry, select_on_map)
+
+    update_choropleth(fig)
+
+    return fig
+
+
+def update_choropleth(fig):
+    color_bar = fig.select_one({'type': ColorBar})
+    low, high = select_range(settings.INDICATORS, select_indicator.value)
+    color_bar.color_mapper.update(low=low, high=high)
+    color_bar.title = format_label(select_indicator.value)
+
+    # fixed column names, in the client mode the columns of the selected year
+    fields = ['indicator', 'by']
+    if settings.CLIENT_UPDATES:
+        fields = [field(indicator_col(select_indicator.value)), field(indicator_col(select_by.value))]
+    renderer = fig.renderers[0]
+    if renderer.glyph.fill_color['field'] != fields[0]:
+        update_glyphs(renderer, fill_color={'field': fields[0], 'transform': color_bar.color_mapper})
+
+    # set tooltips
+    fig.hover.tooltips = create_tooltips([select_indicator.value, select_by.value], fields)
+
+
+def line_chart(countries=[]):
+    fig = figure(
+        height=settings.COL2_HEIGHT1,
+        width=settings.COL2_WIDTH,
+        x_range=(settings.DATES[0], settings.DATES[-1]),
+        y_range=select_range(settings.INDICATORS, select_indicator.value)
+    )
+    fig.xaxis.axis_label = 'Year'
+    fig.add_layout(Legend(), 'right')
+    fig.title.text = 'Development over Years'
+    fig.title.align = 'center'
+    fig.title.text_font_size = '20px'
+
+    # all lines are rows of one source, the legend is grouped in the browser
+    fig.multi_line('xs', line_field(indicator_col()), source=ColumnDataSource(name='lines'), color='color',
+                   legend_field='label')
+
+    update_line_chart(fig, countries)
+
+    return fig
+
+
+def update_line_chart(fig, countries=[], lines=None):
+    fig.y_range.start, fig.y_range.end = select_range(settings.INDICATORS, select_indicator.value)
+    fig.yaxis.axis_label = format_label(select_indicator.value)
+    fig.legend.title = format_label(select_group.value if len(countries) < 1 else 'country_name')
+    update_glyphs(fig.renderers[0], ys=line_field(indicator_col()))
+    fig.renderers[0].data_source.data = line_data(widget_state(), countries) if lines is None else lines
+
+
+def line_order(lines, year):
+    # positions of the lines by their value in the year, highest first
+    return lines[year].rank(ascending=False, method='first', na_option='bottom').values.argsort()
+
+
+def cap_lines(lines, labels, order):
+    # the first MAX_LINES lines of the order, the others are dropped or averaged into one line
+    if len(lines) <= settings.MAX_LINES:
+        return lines, labels
+
+    top, rest = order[:settings.MAX_LINES], order[settings.MAX_LINES:]
+    capped, capped_labels = lines.iloc[top], [labels[i] for i in top]
+    if settings.LINE_OVERFLOW == 'aggregate':
+        capped = pd.concat([capped, lines.iloc[rest].mean().rename('other').to_frame().T])
+        capped_labels.append(f'Other ({len(rest)} countries)')
+    return capped, capped_labels
+
+
+def line_data(state, countries=[]):
+    # the client mode also sends the lines of every other level and gender
+    columns = [state.column()]
+    if settings.CLIENT_UPDATES:
+        columns += [column for column in variant_columns(state, state.indicator) if column != columns[0]]
+    if len(countries) < 1:
+        return cached(('group_lines', state.group, state.weighted, *columns),
+                      partial(group_lines, state.group, state.weighted, columns))
+
+    countries = tuple(countries)
+    return cached(('country_lines', state.year, *columns, countries),
+                  partial(country_lines, countries, state.year, columns))
+
+
+def group_lines(group_by, weighted, columns):
+    # one row per line (years x values) from a single pivot per indicator column
+    data = get_group_means(group_by, weighted=weighted)
+    labels = settings.GROUPS[group_by]
+    lines = {column: data[column].unstack('year').reindex(labels) for column in columns}
+    return lines_source(lines, labels, [color_by_group(group, group_by) for group in labels])
+
+
+def country_lines(countries, year, columns):
+    data = get_countries(countries, [*columns, 'country_name'])
+    names = data['country_name'].groupby(level='country_code').first()
+    lines = {column: data[column].unstack('year').reindex(columns=settings.DATES) for column in columns}
+    # the lines of every column keep the countries ranked by the selected one
+    first = lines[columns[0]]
+    order = line_order(first, year)
+    labels = list(names.reindex(first.index))
+    capped = {column: cap_lines(frame, labels, order) for column, frame in lines.items()}
+    lines = {column: frame for column, (frame, _) in capped.items()}
+    labels = capped[columns[0]][1]
+    colors = [color_sequential(len(labels), i) for i in range(len(labels))]
+    if len(labels) > settings.MAX_LINES:
+        colors[-1] = settings.LINE_OVERFLOW_COLOR
+    return lines_source(lines, labels, colors)
+
+
+def lines_source(lines, labels, colors):
+    years = next(iter(lines.values())).columns.values
+    data = {'xs': [years] * len(labels)}
+    data.update({line_field(column): list(frame.values) for column, frame in lines.items()})
+    data.update({'label': labels, 'color': colors})
+    return data
+
+
+def bar_chart(title, options, colors, dodge_values, type, bars=None):
+    fig = figure(
+        height=settings.COL2_HEIGHT2,
+        width=settings.COL2_WIDTH,
+        x_range=FactorRange(),
+        y_range=(0, 1),
+        toolbar_location=None,
+        tools=''
+    )
+
+    # one bar per possible option, options not available for the selection are hidden
+    source = ColumnDataSource(name=f'bar_chart_{type}')
+    for option in options:
+        renderer = fig.vbar(
+            x=dodge(select_group.value, dodge_values[0], range=fig.x_range),
+            top=field(indicator_col()),
+            source=source,
+            width=0.15,
+            color=colors[option],
+            alpha=0.7
+        )
+        renderer.tags = [option]
+    fig.add_layout(Legend(), 'right')
+    fig.xaxis.major_label_orientation = 120
+    fig.title.text = title
+    fig.title.align = 'center'
+    fig.title.text_font_size = '20px'
+
+    update_bar_chart(fig, dodge_values, type, bars)
+
+    return fig
+
+
+def bar_widget(type):
+    return select_gender if type == 'gender' else select_level
+
+
+def bar_data(state, type, data=None):
+    # x column, factors and source data of a bar chart for the selected countries (`data`) or else the
+    # group means of the year, computed outside the document lock
+    if data is None:
+        x = state.group
+        if settings.CLIENT_UPDATES:
+            data = all_years(group_means(state), variant_columns(state, state.indicator)).reset_index()
+        else:
+            data = group_means(state, state.year).reset_index()
+    else:
+        x = 'country_name'
+
+    if settings.CLIENT_UPDATES:
+        # the browser switches between the columns of every year, level and gender
+        columns = list(data.columns)
+    else:
+        # hidden bars point to a column that exists for every selection
+        options = state.genders if type == 'gender' else state.levels
+        columns = [x] + [state.column(**{type: option}) if option in options else state.column()
+                         for option in (settings.GENDER if type == 'gender' else settings.LEVELS)]
+
+    # assigning a DataFrame makes bokeh format it for a validation message first
+    return x, list(data[x]), ColumnDataSource.from_df(project(data, columns))
+
+
+def bars_data(state, data=None):
+    return {type: bar_data(state, type, data) for type in ['gender', 'level']}
+
+
+def update_bar_chart(fig, dodge_values, type, bars=None):
+    x, factors, data = bar_data(widget_state(), type) if bars is None else bars
+
+    fig.x_range.factors = factors
+    fig.y_range.end = select_range(settings.INDICATORS, select_indicator.value)[1]
+    fig.yaxis.axis_label = format_label(select_indicator.value)
+
+    widget = bar_widget(type)
+    options = [option for option, _ in widget.options]
+    items = []
+    for renderer in fig.renderers:
+        option = renderer.tags[0]
+        renderer.visible = option in options
+        # move the existing dodge transform instead of creating a new one, hidden bars are reset to the
+        # first position and a column that exists for every selection
+        i = options.index(option) if renderer.visible else 0
+        transform = renderer.glyph.x['transform']
+        transform.value = dodge_values[i]
+        if renderer.glyph.x['field'] != x:
+            update_glyphs(renderer, x={'field': x, 'transform': transform})
+        if renderer.visible:
+            items.append((widget.options[i][1], renderer))
+            top = field(indicator_col(**{type: option}))
+        else:
+            top = field(indicator_col())
+        update_glyphs(renderer, top=top)
+
+    fig.renderers[0].data_source.data = data
+
+    legend = fig.legend[0]
+    if [(item.label['value'], item.renderers[0]) for item in legend.items] != items:
+        legend.items = [LegendItem(label=label, renderers=[renderer]) for label, renderer in items]
+
+
+def bar_chart_gender(bars=None):
+    return bar_chart(
+        'Difference by Gender', settings.GENDER, settings.GENDER_COLORS, settings.GENDER_DODGE, 'gender', bars)
+
+
+def update_bar_chart_gender(fig, bars=None):
+    update_bar_chart(fig, settings.GENDER_DODGE, 'gender', bars)
+
+
+def bar_chart_level(bars=None):
+    return bar_chart(
+        'Difference by Education Level', settings.LEVELS, settings.LEVEL_COLORS, settings.LEVEL_DODGE, 'level', bars)
+
+
+def update_bar_chart_level(fig, bars=None):
+    update_bar_chart(fig, settings.LEVEL_DODGE, 'level', bars)
+
+
+# add tools and different plots to oune dashboard
+tools = column(slider_year, select_indicator, select_by, select_level, select_gender, select_group, checkbox_group)
+figures = {
+    'choropleth': choropleth(),
+    'scatter': scatter(),
+    'line_chart': line_chart(),
+    'bar_chart_gender': bar_chart_gender(),
+    'bar_chart_level': bar_chart_level(),
+}
+dashboard = layout(
+    row(
+        column(
+            row(
+                column(
+                    tools,
+                    width=settings.TOOL_WIDTH
+                ),
+                figures['choropleth'],
+                height=settings.COL1_HEIGHT
+            ),
+            row(figures['scatter'], height=settings.COL1_HEIGHT),
+            width=settings.COL1_WIDTH
+        ),
+        column(
+            row(figures['line_chart'], height=settings.COL2_HEIGHT1),
+            row(figures['bar_chart_gender'], height=settings.COL2_HEIGHT2),
+            row(figures['bar_chart_level'], height=settings.COL2_HEIGHT2),
+            width=settings.COL2_WIDTH
+        )
+    )
+)
+
+# client mode: the sources hold every year, level and gender of the selected columns, the browser only
+# points the glyphs, tooltips and ranges to other columns (the same fields the server would set)
+CLIENT_UPDATE = '''
+const year = slider.value
+const col = (name, level = select_level.value, gender = select_gender.value) => `${name}_${level}_${gender}`
+const field = (column) => `${column}:${year}`
+const indicator = col(select_indicator.value)
+const by = col(select_by.value)
+
+function update_glyphs(renderer, properties) {
+    for (const glyph of [renderer.glyph, renderer.hover_glyph, renderer.selection_glyph, renderer.nonselection_glyph])
+        if (glyph != null)
+            glyph.setv(properties)
+}
+
+function update_tooltips(hover) {
+    // country, indicator and by (see create_tooltips)
+    const [country, indicator_tooltip, by_tooltip] = hover.tooltips
+    hover.tooltips = [country, [indicator_tooltip[0], `@{${field(indicator)}}`], [by_tooltip[0], `@{${field(by)}}`]]
+}
+
+update_glyphs(scatter.renderers[0], {x: {field: field(by)}, y: {field: field(indicator)}})
+update_tooltips(scatter_hover)
+scatter.x_range.setv({start: ranges[by][0], end: ranges[by][1]})
+scatter.y_range.setv({start: ranges[indicator][0], end: ranges[indicator][1]})
+
+update_glyphs(choropleth.renderers[0], {fill_color: {field: field(indicator), transform: color_mapper}})
+update_tooltips(choropleth_hover)
+color_mapper.setv({low: ranges[indicator][0], high: ranges[indicator][1]})
+
+for (const [fig, type] of [[bar_chart_gender, 'gender'], [bar_chart_level, 'level']]) {
+    for (const renderer of fig.renderers) {
+        const option = renderer.tags[0]
+        // hidden bars point to a column that exists for every selection
+        let column = indicator
+        if (renderer.visible)
+            column = type == 'gender' ? col(select_indicator.value, undefined, option) : col(select_indicator.value, option)
+        update_glyphs(renderer, {top: {field: field(column)}})
+    }
+    fig.y_range.end = ranges[indicator][1]
+}
+
+update_glyphs(line_chart.renderers[0], {ys: {field: `ys:${indicator}`}})
+line_chart.y_range.setv({start: ranges[indicator][0], end: ranges[indicator][1]})
+'''
+
+
+def client_args():
+    return dict(
+        figures,
+        slider=slider_year,
+        select_indicator=select_indicator,
+        select_by=select_by,
+        select_level=select_level,
+        select_gender=select_gender,
+        scatter_hover=figures['scatter'].select_one({'type': HoverTool}),
+        choropleth_hover=figures['choropleth'].select_one({'type': HoverTool}),
+        color_mapper=figures['choropleth'].select_one({'type': ColorBar}).color_mapper,
+        ranges=client_ranges(),
+    )
+
+
+if settings.CLIENT_UPDATES:
+    client_update = CustomJS(args=client_args(), code=CLIENT_UPDATE)
+    for widget in [slider_year, select_level, select_gender]:
+        widget.js_on_change('value', client_update)
+
+
+def observe_payload(event):
+    # serialized size of every source data change, binary arrays included, as sent to the browser
+    if isinstance(event, ModelChangedEvent) and isinstance(event.model, ColumnDataSource) and event.attr == 'data':
+        message = Protocol().create('PATCH-DOC', [event])
+        size = len(message.content_json) + sum(len(payload) for _, payload in message.buffers)
+        observe('dashboard_payload_bytes', size, source=event.model.name or 'other')
+
+
+def data_size(value):
+    # bytes of a source column: array buffers, nested arrays (patches, lines) and python objects
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return value.nbytes
+    return sys.getsizeof(value) + sum(
+        data_size(item) if isinstance(item, (np.ndarray, list)) else sys.getsizeof(item) for item in value)
+
+
+def session_data_bytes(doc):
+    return sum(data_size(column) for model in doc.select({'type': ColumnDataSource}) for column in model.data.values())
+
+
+if settings.METRICS:
+    curdoc().on_change(observe_payload)
+    if curdoc().session_context is not None:
+        track_session(curdoc().session_context.id, partial(session_data_bytes, curdoc()))
+
+curdoc().add_root(dashboard)
+curdoc().title = 'World Education Dashboard'
@@ -0,0 +1,164 @@
+import cProfile
+import io
+import pstats
+import random
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from config import Config
+
+# histogram families of the process: help text and bucket upper bounds
+SECONDS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+FAMILIES = {
+    'dashboard_callback_seconds': ('Duration of the widget callbacks of a session (with background '
+                                   'callbacks only until the job is submitted)', SECONDS),
+    'dashboard_job_seconds': ('Duration of the callback jobs: data work (compute), model changes under the '
+                              'document lock (apply) and from the request until applied (total)', SECONDS),
+    'dashboard_loader_seconds': ('Duration of the data loaders (calls in process pool workers are not '
+                                 'recorded)', SECONDS),
+    'dashboard_payload_bytes': ('Serialized size of the source data changes sent to the browser',
+                                [1024 * 4 ** i for i in range(9)]),
+}
+
+_lock = Lock()
+_histograms = {}
+# session id -> function returning the bytes of the data its sources hold
+_sessions = {}
+# cProfile stats of the sampled calls, _profile_lock is held while a call is profiled
+_profile = {'stats': None, 'calls': 0}
+_profile_lock = Lock()
+
+
+class Histogram():
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # observations per bucket (not cumulative), the last one counts values above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def observe(family, value, **labels):
+    if not Config.METRICS:
+        return
+    key = (family, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(FAMILIES[family][1])
+        histogram.observe(value)
+
+
+@contextmanager
+def profiled():
+    # a random share (Config.PROFILE_SAMPLE_RATE) of the timed calls runs under cProfile, calls that start
+    # while another one is profiled (in another thread or nested) are not sampled
+    if not Config.PROFILE_SAMPLE_RATE or random.random() >= Config.PROFILE_SAMPLE_RATE \
+            or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+        yield
+    finally:
+        profile.disable()
+        _profile_lock.release()
+        with _lock:
+            if _profile['stats'] is None:
+                _profile['stats'] = pstats.Stats(profile)
+            else:
+                _profile['stats'].add(profile)
+            _profile['calls'] += 1
+
+
+@contextmanager
+def timer(family, **labels):
+    start = time.perf_counter()
+    try:
+        with profiled():
+            yield
+    finally:
+        observe(family, time.perf_counter() - start, **labels)
+
+
+def timed(family, label):
+    # decorator recording the duration of every call in `family`, labeled with the function's name
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not Config.METRICS:
+                return function(*args, **kwargs)
+            with timer(family, **{label: function.__name__}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def track_session(session_id, data_bytes):
+    _sessions[session_id] = data_bytes
+
+
+def untrack_session(session_id):
+    _sessions.pop(session_id, None)
+
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}' if labels else ''
+
+
+def render():
+    # every metric in the Prometheus text exposition format
+    with _lock:
+        histograms = [
+            (family, labels, list(histogram.counts), histogram.sum, histogram.count)
+            for (family, labels), histogram in sorted(_histograms.items())
+        ]
+
+    lines = []
+    for family, (description, buckets) in FAMILIES.items():
+        lines += [f'# HELP {family} {description}', f'# TYPE {family} histogram']
+        for name, labels, counts, total, count in histograms:
+            if name != family:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip([*map(float, buckets), '+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{family}_bucket{format_labels([*labels, ("le", bound)])} {cumulative}')
+            lines.append(f'{family}_sum{format_labels(labels)} {total}')
+            lines.append(f'{family}_count{format_labels(labels)} {count}')
+
+    sessions = dict(_sessions)
+    lines += [
+        '# HELP dashboard_sessions Open dashboard sessions',
+        '# TYPE dashboard_sessions gauge',
+        f'dashboard_sessions {len(sessions)}',
+        '# HELP dashboard_session_data_bytes Bytes of the data held by the sources of a session (arrays shared '
+        'with other sessions or the chart cache are counted for every session)',
+        '# TYPE dashboard_session_data_bytes gauge',
+    ]
+    lines += [
+        f'dashboard_session_data_bytes{format_labels([("session", session_id)])} {data_bytes()}'
+        for session_id, data_bytes in sessions.items()
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def profile_report(sort='cumulative', limit=50):
+    # the accumulated cProfile stats of the sampled calls as text
+    with _lock:
+        if _profile['stats'] is None:
+            return 'no profiled calls, set Config.PROFILE_SAMPLE_RATE to sample calls\n'
+        output = io.StringIO()
+        output.write(f'{_profile["calls"]} profiled calls\n')
+        stats = _profile['stats']
+        stats.stream = output
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
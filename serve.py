@@ -0,0 +1,51 @@
+import argparse
+import pstats
+from pathlib import Path
+from bokeh.application import Application
+from bokeh.application.handlers import DirectoryHandler
+from bokeh.server.server import Server
+from tornado.web import HTTPError, RequestHandler
+import metrics
+
+APP_PATH = Path(__file__).parent
+
+
+class MetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics.render())
+
+
+class ProfileHandler(RequestHandler):
+    def get(self):
+        sort, limit = self.get_argument('sort', 'cumulative'), self.get_argument('limit', '50')
+        if sort not in pstats.Stats.sort_arg_dict_default or not limit.isdigit():
+            raise HTTPError(400, 'sort must be a pstats sort key and limit a number of rows')
+        self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        self.write(metrics.profile_report(sort, int(limit)))
+
+
+def create_server(port=5006, address=None, allow_websocket_origin=None):
+    # the dashboard like `bokeh serve .` (same app path) with the metrics endpoints next to it
+    return Server(
+        {f'/{APP_PATH.name}': Application(DirectoryHandler(filename=str(APP_PATH)))},
+        port=port,
+        address=address,
+        allow_websocket_origin=allow_websocket_origin,
+        extra_patterns=[('/metrics', MetricsHandler), ('/metrics/profile', ProfileHandler)],
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the dashboard with Prometheus metrics at /metrics.')
+    parser.add_argument('--port', type=int, default=5006)
+    parser.add_argument('--address', help='address to listen on (default: all)')
+    parser.add_argument('--allow-websocket-origin', nargs='+', help='hosts that may connect to the sessions')
+    parser.add_argument('--show', action='store_true', help='open the dashboard in a browser')
+    args = parser.parse_args()
+
+    server = create_server(args.port, args.address, args.allow_websocket_origin)
+    server.start()
+    if args.show:
+        server.io_loop.add_callback(server.show, f'/{APP_PATH.name}')
+    server.io_loop.start()
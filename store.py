@@ -0,0 +1,214 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+import numpy as np
+import pandas as pd
+from bokeh.application import Application
+from bokeh.application.handlers import DirectoryHandler
+from shapely.strtree import STRtree
+from data import get_merged_data, get_geo_data, create_geo_patches, partition_by_year, aggregate_by_group, LongData
+from config import Config
+
+# datasets shared by every dashboard session of the server process
+_datasets = {}
+_lock = Lock()
+_executor = None
+
+
+class ChartCache():
+    # least recently used chart data by widget state, values are shared and must not be mutated
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        # computed without the lock, concurrent misses of the same key compute it more than once
+        value = compute()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_chart_cache = ChartCache(Config.CHART_CACHE_SIZE)
+
+
+def read_only(df):
+    # object blocks stay writeable, pandas' cython comparisons reject read-only object buffers
+    for block in df._mgr.blocks:
+        if isinstance(block.values, np.ndarray) and block.values.dtype != object:
+            block.values.flags.writeable = False
+    return df
+
+
+def column_ranges(df):
+    # min, max and the robust quantiles of every numeric column over all years
+    numeric = df.select_dtypes('number')
+    low, high = Config.RANGE_QUANTILES
+    stats = pd.concat([numeric.min(), numeric.max(), numeric.quantile(low), numeric.quantile(high)], axis=1)
+    return {column: tuple(values) for column, values in zip(stats.index, stats.values.tolist())}
+
+
+def load():
+    with _lock:
+        if not _datasets:
+            df = read_only(get_merged_data(parallel=Config.PARALLEL_LOADING, ffill_limit=Config.FFILL_LIMIT))
+            _datasets['ranges'] = column_ranges(df)
+            # (group, year) aggregates for the line and bar charts, plain and population weighted
+            _datasets['groups'] = {
+                (group, weighted): read_only(aggregate_by_group(df, group, Config.GROUP_WEIGHT if weighted else None))
+                for group in Config.GROUP_BY for weighted in [False, True]
+            }
+            if Config.STORAGE == 'long':
+                # only the long values and the (country, year) metadata are kept in memory
+                _datasets['long'] = LongData(df)
+                _datasets['df'] = df.select_dtypes(exclude='number')
+            else:
+                _datasets['df'] = df
+                _datasets['years'] = {year: read_only(frame) for year, frame in partition_by_year(df).items()}
+            _datasets['df_geo'] = read_only(get_geo_data())
+            # polygon coordinates are serialised once per resolution, per year only attributes change
+            _datasets['geo_patches'] = [
+                create_geo_patches(_datasets['df_geo'], resolution['tolerance'], Config.GEO_DTYPE)
+                for resolution in Config.GEO_RESOLUTIONS
+            ]
+            # row of every country in the geo frame (and the map source) and a spatial index of the
+            # (unsimplified) geometries for hit-testing selections on the map
+            _datasets['geo_positions'] = {country: i for i, country in enumerate(_datasets['df_geo'].index)}
+            _datasets['geo_tree'] = STRtree(list(_datasets['df_geo'].geometry))
+    return _datasets
+
+
+def get_executor():
+    # one thread pool per process for the data work of every session's callbacks
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(Config.CALLBACK_WORKERS, thread_name_prefix='dashboard')
+    return _executor
+
+
+def create_document():
+    # a session document of the dashboard without a server (for the benchmark and the static export),
+    # there is no event loop running throttled or background callbacks, so they run synchronously
+    # (and without recording metrics)
+    Config.CALLBACK_THROTTLE = 0
+    Config.SLIDER_THROTTLED = False
+    Config.BACKGROUND_CALLBACKS = False
+    Config.METRICS = False
+    return Application(DirectoryHandler(filename=str(Path(__file__).parent))).create_document()
+
+
+def cached(key, compute):
+    return _chart_cache.get(key, compute)
+
+
+def clear_cache():
+    _chart_cache.clear()
+
+
+def get_cache_stats():
+    return _chart_cache.stats()
+
+
+def get_memory_usage():
+    # bytes of the stored dataset: the merged frame and its year partitions, or the long values with the
+    # (country, year) metadata
+    datasets = load()
+    if 'long' in datasets:
+        return datasets['long'].memory_usage() + datasets['df'].memory_usage(deep=True).sum()
+    return datasets['df'].memory_usage(deep=True).sum() \
+        + sum(frame.memory_usage(deep=True).sum() for frame in datasets['years'].values())
+
+
+def get_data():
+    # the merged frame (only its metadata columns with long storage) and the geo frame
+    datasets = load()
+    return datasets['df'], datasets['df_geo']
+
+
+def get_geo_patches(resolution=0):
+    return load()['geo_patches'][resolution]
+
+
+def get_geo_positions(countries):
+    # rows of the `countries` in the map source, countries without geometry are left out
+    positions = load()['geo_positions']
+    return [positions[country] for country in countries if country in positions]
+
+
+def query_geo(geometry, predicate='intersects'):
+    # country codes whose geometry `predicate`s (shapely, e.g. 'intersects' or 'within') the `geometry`,
+    # the tree only yields the candidates with overlapping bounds (shapely 1.8 returns positions with
+    # query_items, shapely 2 with query)
+    datasets = load()
+    tree = datasets['geo_tree']
+    candidates = tree.query_items(geometry) if hasattr(tree, 'query_items') else tree.query(geometry)
+    geometries = datasets['df_geo'].geometry
+    return [
+        geometries.index[i] for i in sorted(candidates)
+        if getattr(geometries.iloc[i], predicate)(geometry)
+    ]
+
+
+def get_year(year, columns=None):
+    datasets = load()
+    if 'long' in datasets:
+        long = datasets['long']
+        return long.year_frame(year, list(long.keys) + list(long.meta.columns) if columns is None else columns)
+
+    df = datasets['years'][year]
+    if columns is None:
+        return df
+    return df[[column for column in dict.fromkeys(columns) if column in df.columns]]
+
+
+def get_countries(countries, columns):
+    datasets = load()
+    if 'long' in datasets:
+        return datasets['long'].countries_frame(countries, columns)
+
+    df = datasets['df']
+    df = df[df.index.get_level_values('country_code').isin(countries)]
+    return df[[column for column in dict.fromkeys(columns) if column in df.columns]]
+
+
+def get_range(column, robust=False):
+    minimum, maximum, low, high = load()['ranges'][column]
+    return (low, high) if robust else (minimum, maximum)
+
+
+def get_group_means(group, year=None, weighted=False):
+    means = load()['groups'][(group, weighted)]
+    if year is not None:
+        means = means.xs(year, level='year')
+    return means